@@ -6,10 +6,9 @@ output_file = "output.csv"
 
 # Read and write
 with open(input_file, "r") as infile, open(output_file, "w", newline="") as outfile:
-    reader = (line.strip().split() for line in infile)  # Split by any whitespace
     writer = csv.writer(outfile)
-
-    for row in reader:
-        writer.writerow(row)
+    # Split by any whitespace; map + writerows keeps the whole loop in C.
+    # (pandas/np.loadtxt would pad the ragged 3-field second row.)
+    writer.writerows(map(str.split, infile))
 
 print(f"CSV file created successfully: {output_file}")
@@ -4,25 +4,34 @@ import numpy as np
 import pandas as pd
 from PyQt5 import QtWidgets, QtCore
 import pyqtgraph as pg
-from scipy.signal import iirnotch, butter, filtfilt
+from scipy.signal import iirnotch, butter, tf2sos, sosfilt, sosfilt_zi
+
+# OpenGL rendering, no antialiasing for the scrolling traces (set before the window is built)
+pg.setConfigOptions(useOpenGL=True, antialias=False, enableExperimental=True)
 
 class EMGRealTimePlot(QtWidgets.QMainWindow):
-    def __init__(self, data, sample_interval=0.002, window_time=5.0):
+    def __init__(self, data, sample_interval=0.002, window_time=5.0, seed=None):
         super().__init__()
         self.setWindowTitle("Real-Time EMG with Noise & Filters (PyQt5)")
         self.resize(1000, 500)
 
         # Parameters
         self.data = data
+        self.t_arr = data["time"].to_numpy()
+        self.sig_arr = data["signal"].to_numpy()
         self.sample_interval = sample_interval
         self.window_time = window_time
         self.fs = 1.0 / sample_interval  # Sampling frequency (500 Hz)
         self.start_time = time.time()
         self.data_index = 0
+        self.rng = np.random.default_rng(seed)
 
-        # Buffers
-        self.x_buffer = []
-        self.y_buffer = []
+        # Ring buffers (stored twice back-to-back so the window is always one contiguous slice)
+        self.N = int(window_time / sample_interval)
+        self.xbuf = np.empty(2 * self.N, dtype=np.float64)
+        self.ybuf = np.empty(2 * self.N, dtype=np.float64)
+        self.head = 0
+        self.filled = 0
 
         # ===== Plot Setup =====
         self.plot_widget = pg.PlotWidget()
@@ -31,7 +40,8 @@ class EMGRealTimePlot(QtWidgets.QMainWindow):
         self.plot_widget.setLabel('left', 'Amplitude (V)')
         self.plot_widget.setLabel('bottom', 'Time (s)')
         self.plot_widget.showGrid(x=True, y=True, alpha=0.4)
-        pg.setConfigOptions(useOpenGL=True)
+        self.plot_widget.setAntialiasing(False)
+        self.plot_widget.disableAutoRange()
         self.curve = self.plot_widget.plot(pen=pg.mkPen(color='lime', width=2))
 
         # ===== Pre-compute Filters =====
@@ -40,7 +50,13 @@ class EMGRealTimePlot(QtWidgets.QMainWindow):
         self.b_notch_100, self.a_notch_100 = iirnotch(100, Q=30, fs=self.fs)
 
         # Low-pass filter (Butterworth, cutoff below Nyquist = 200 Hz)
-        self.b_low, self.a_low = butter(4, 200 / (0.5 * self.fs), btype='low', analog=False)
+        sos_low = butter(4, 200 / (0.5 * self.fs), btype='low', output='sos')
+
+        # Cascade all stages into one SOS filter, run statefully on new samples only
+        self.sos = np.vstack([tf2sos(self.b_notch_50, self.a_notch_50),
+                              tf2sos(self.b_notch_100, self.a_notch_100),
+                              sos_low])
+        self.zi = None  # Initialised from the first sample
 
         # Timer
         self.timer = QtCore.QTimer()
@@ -48,49 +64,57 @@ class EMGRealTimePlot(QtWidgets.QMainWindow):
         self.timer.start(int(self.sample_interval * 1000))
 
     def add_noise(self, t, signal):
-        """Add 50 Hz, 2 MHz, 3 MHz noise (1 mV amplitude each)."""
+        """Add 50 Hz hum and broadband HF noise (1 mV amplitude each)."""
         A = 0.001
         noise_50Hz = A * np.sin(2 * np.pi * 50 * t)
-        noise_2MHz = A * np.sin(2 * np.pi * 2_000_000 * t)
-        noise_3MHz = A * np.sin(2 * np.pi * 3_000_000 * t)
-        return signal + noise_50Hz + noise_2MHz + noise_3MHz
+        # 2/3 MHz tones alias to arbitrary values at 500 Hz, so model them as white noise
+        noise_hf = A * self.rng.standard_normal(len(t))
+        return signal + noise_50Hz + noise_hf
 
     def apply_filters(self, signal):
-        """Apply notch filters (50,100 Hz) + low-pass (200 Hz)."""
-        filtered = filtfilt(self.b_notch_50, self.a_notch_50, signal)
-        filtered = filtfilt(self.b_notch_100, self.a_notch_100, filtered)
-        filtered = filtfilt(self.b_low, self.a_low, filtered)
+        """Apply notch filters (50,100 Hz) + low-pass (200 Hz) to a new chunk, carrying state."""
+        if self.zi is None:
+            self.zi = sosfilt_zi(self.sos) * signal[0]
+        filtered, self.zi = sosfilt(self.sos, signal, zi=self.zi)
         return filtered
 
+    def push_samples(self, t, y):
+        """Write a chunk of samples into both halves of the ring buffers."""
+        if len(t) > self.N:
+            t, y = t[-self.N:], y[-self.N:]
+        k = len(t)
+        first = min(k, self.N - self.head)
+        for buf, chunk in ((self.xbuf, t), (self.ybuf, y)):
+            buf[self.head:self.head + first] = chunk[:first]
+            buf[self.head + self.N:self.head + self.N + first] = chunk[:first]
+            buf[:k - first] = chunk[first:]
+            buf[self.N:self.N + k - first] = chunk[first:]
+        self.head = (self.head + k) % self.N
+        self.filled = min(self.filled + k, self.N)
+
     def update_plot(self):
         now = time.time() - self.start_time
 
-        while self.data_index < len(self.data) and self.data["time"].iloc[self.data_index] <= now:
-            t = self.data["time"].iloc[self.data_index]
-            raw_signal = self.data["signal"].iloc[self.data_index]
-            noisy_signal = self.add_noise(t, raw_signal)
-            self.x_buffer.append(t)
-            self.y_buffer.append(noisy_signal)
-            self.data_index += 1
-
-        # Trim to 5 s window
-        while self.x_buffer and (self.x_buffer[-1] - self.x_buffer[0]) > self.window_time:
-            self.x_buffer.pop(0)
-            self.y_buffer.pop(0)
-
-        # Apply filters
-        if len(self.y_buffer) > 10:
-            y_filtered = self.apply_filters(np.array(self.y_buffer))
-        else:
-            y_filtered = np.array(self.y_buffer)
-
-        if self.x_buffer:
-            self.curve.setData(self.x_buffer, y_filtered)
-            self.plot_widget.setXRange(self.x_buffer[0],
-                                       self.x_buffer[0] + self.window_time,
+        # All samples with time <= now, taken as one slice
+        end = np.searchsorted(self.t_arr, now, side='right')
+        new_t = self.t_arr[self.data_index:end]
+        new_s = self.add_noise(new_t, self.sig_arr[self.data_index:end])
+        self.data_index = end
+
+        # Filter only the freshly appended samples
+        if len(new_t):
+            self.push_samples(new_t, self.apply_filters(new_s))
+
+        if self.filled:
+            start = (self.head - self.filled) % self.N
+            x_view = self.xbuf[start:start + self.filled]
+            y_view = self.ybuf[start:start + self.filled]
+            self.curve.setData(x_view, y_view)
+            self.plot_widget.setXRange(x_view[0],
+                                       x_view[0] + self.window_time,
                                        padding=0)
 
-        if self.data_index >= len(self.data):
+        if self.data_index >= len(self.t_arr):
             self.timer.stop()
             print("Streaming complete.")
 
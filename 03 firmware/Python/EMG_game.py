@@ -3,17 +3,20 @@ import os
 import random
 import sys
 import socket
-import struct
 import threading
-import collections
 import numpy as np
-from scipy.signal import butter, sosfilt, sosfilt_zi, iirnotch, lfilter, lfilter_zi
+from numba import njit
+from scipy.signal import butter, sosfilt_zi, iirnotch, tf2sos
 
 # --- EMG CONFIGURATION ---
 DEFAULT_PORT = 8888
 SAMPLE_RATE = 25000.0   # 25 kSPS
+ENVELOPE_DECIM = 25     # Envelope runs at 1 kSPS (bandpass already limits to 150 Hz)
+RCVBUF_SIZE = 4 << 20   # Room for a few seconds of packets if the thread stalls
+PACKET_SIZE = 65507     # Max UDP payload (receive buffer must fit any datagram)
 VOLTAGE_REF = 1.65
 ADC_MAX_VAL = 512.0
+_ADC_SCALE = VOLTAGE_REF / ADC_MAX_VAL # Volts per ADC count
 EMG_THRESHOLD = 0.3    # Default threshold (Adjustable)
 JUMP_COOLDOWN = 200     # ms
 
@@ -41,34 +44,57 @@ PLOT_BG = (20, 20, 20)
 PLOT_LINE = (0, 255, 0)
 THRESH_LINE = (255, 255, 0)
 
+@njit(cache=True, fastmath=True, nogil=True)
+def sosfilt_df2t(x, sos, zi):
+    """Same as sosfilt, but filters x in place and updates zi in place."""
+    for s in range(sos.shape[0]): # One full pass per section
+        b0, b1, b2 = sos[s, 0], sos[s, 1], sos[s, 2]
+        a1, a2 = sos[s, 4], sos[s, 5]
+        z0, z1 = zi[s, 0], zi[s, 1]
+        for n in range(x.shape[0]):
+            v = x[n]
+            out = b0 * v + z0
+            z0 = b1 * v - a1 * out + z1
+            z1 = b2 * v - a2 * out
+            x[n] = out
+        zi[s, 0] = z0
+        zi[s, 1] = z1
+    return x
+
 class EMGHandler:
     def __init__(self, port=DEFAULT_PORT):
         self.port = port
         self.running = False
+        # Written only by the receive thread; a float attribute store is atomic
+        # under the GIL, so the game loop reads it without a lock
         self.current_envelope = 0.0
-        self.lock = threading.Lock()
         
         # Filtering State
-        self.notch_coeffs = []
-        self.notch_zis = []
+        self.notch_sos = None
         self.init_notch_filters()
         
         self.bp_sos = None
-        self.bp_zi = None
         self.init_bandpass_filter()
+
+        self.cascade_sos = None
+        self.cascade_zi = None
+        self.init_cascade_filter()
         
         self.lp_sos = None
         self.lp_zi = None
         self.init_lowpass_filter()
+        self.decim_phase = 0 # Offset of the next kept sample in the following chunk
+
+        # Warm up the JIT so the receive thread doesn't stall on its first packet
+        dummy = np.zeros(1, dtype=np.float32)
+        sosfilt_df2t(dummy, self.cascade_sos, np.zeros((len(self.cascade_sos), 2)))
+        sosfilt_df2t(dummy, self.lp_sos, np.zeros((len(self.lp_sos), 2)))
 
     def init_notch_filters(self):
         freqs = [50.0, 100.0, 150.0]
         quality_factor = 30.0
-        for f in freqs:
-            b, a = iirnotch(f, quality_factor, fs=SAMPLE_RATE)
-            self.notch_coeffs.append((b, a))
-            zi = lfilter_zi(b, a)
-            self.notch_zis.append(zi)
+        self.notch_sos = np.vstack([tf2sos(*iirnotch(f, quality_factor, fs=SAMPLE_RATE))
+                                    for f in freqs])
 
     def init_bandpass_filter(self):
         low = 25.0
@@ -76,12 +102,20 @@ class EMGHandler:
         nyquist = SAMPLE_RATE / 2.0
         # 4th order butterworth bandpass
         self.bp_sos = butter(4, [low/nyquist, high/nyquist], btype='bandpass', output='sos')
-        self.bp_zi = sosfilt_zi(self.bp_sos)
+
+    def init_cascade_filter(self):
+        # Notches + bandpass stacked into one SOS array -> a single filter call per chunk.
+        # Samples are float32 but coefficients and state stay float64: the notch
+        # poles sit at r~0.9998 and float32 leaves only ~40 dB of mains rejection.
+        self.cascade_sos = np.ascontiguousarray(np.vstack([self.notch_sos, self.bp_sos]))
+        self.cascade_zi = None # Scaled by the first sample received
 
     def init_lowpass_filter(self):
         cutoff = 5.0 # 5Hz envelope
-        nyquist = SAMPLE_RATE / 2.0
+        nyquist = SAMPLE_RATE / ENVELOPE_DECIM / 2.0
         self.lp_sos = butter(2, cutoff/nyquist, btype='low', output='sos')
+        # |k*x| = k*|x| for k > 0, so the volt conversion rides on the envelope filter
+        self.lp_sos[0, :3] *= _ADC_SCALE
         self.lp_zi = sosfilt_zi(self.lp_sos)
 
     def start(self):
@@ -92,41 +126,43 @@ class EMGHandler:
     def run(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.bind(('0.0.0.0', self.port))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_SIZE)
+        if sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) < RCVBUF_SIZE:
+            print("Warning: UDP receive buffer capped by the OS (raise net.core.rmem_max)")
         sock.settimeout(1.0)
         
         print(f"Listening for EMG on port {self.port}...")
 
+        # Reused for every packet; decoding copies the samples out straight away
+        recv_buf = bytearray(PACKET_SIZE)
+        recv_samples = np.frombuffer(recv_buf, dtype='<i2')
+
         while self.running:
             try:
-                data, _ = sock.recvfrom(4096)
+                nbytes, _ = sock.recvfrom_into(recv_buf)
                 
-                # Decode
-                num_samples = len(data) // 2
-                fmt = '<' + 'h' * num_samples
-                values = struct.unpack(fmt, data)
-                chunk = np.array(values, dtype=float)
+                # Decode (little-endian signed shorts)
+                chunk = recv_samples[:nbytes // 2].astype(np.float32)
 
-                # 1. Notch Filter
-                for i in range(len(self.notch_coeffs)):
-                    b, a = self.notch_coeffs[i]
-                    chunk, self.notch_zis[i] = lfilter(b, a, chunk, zi=self.notch_zis[i])
+                if len(chunk) == 0:
+                    continue
 
-                # 2. Bandpass Filter
-                if self.bp_sos is not None:
-                    chunk, self.bp_zi = sosfilt(self.bp_sos, chunk, zi=self.bp_zi)
+                # 1+2. Notch + Bandpass Filter (one cascade)
+                if self.cascade_zi is None:
+                    self.cascade_zi = sosfilt_zi(self.cascade_sos) * chunk[0]
+                sosfilt_df2t(chunk, self.cascade_sos, self.cascade_zi)
 
-                # Convert to Voltage
-                voltage_chunk = chunk * (VOLTAGE_REF / ADC_MAX_VAL)
+                # Downsample for the envelope (keep stride phase across chunks)
+                decimated = chunk[self.decim_phase::ENVELOPE_DECIM]
+                self.decim_phase = (self.decim_phase - len(chunk)) % ENVELOPE_DECIM
 
-                # 3. Envelope Detection (Rectify + Lowpass)
-                rectified = np.abs(voltage_chunk)
-                envelope_chunk, self.lp_zi = sosfilt(self.lp_sos, rectified, zi=self.lp_zi)
+                # 3. Envelope Detection (Rectify + Lowpass, which also converts to volts)
+                # np.abs makes the one contiguous copy of the strided view
+                envelope_chunk = sosfilt_df2t(np.abs(decimated), self.lp_sos, self.lp_zi)
 
                 # Update current max envelope in this chunk
                 if len(envelope_chunk) > 0:
-                    current_max = np.max(envelope_chunk)
-                    with self.lock:
-                        self.current_envelope = current_max
+                    self.current_envelope = float(np.max(envelope_chunk))
 
             except socket.timeout:
                 continue
@@ -136,8 +172,7 @@ class EMGHandler:
         sock.close()
 
     def get_envelope(self):
-        with self.lock:
-            return self.current_envelope
+        return self.current_envelope
 
 class Bird:
     def __init__(self, game_height):
@@ -196,17 +231,41 @@ class Pipe:
     def collide(self, bird):
         return self.top_rect.colliderect(bird.rect) or self.bottom_rect.colliderect(bird.rect)
 
+_FONT_CACHE = {}
+_TEXT_CACHE = {}
+_TEXT_CACHE_MAX = 256
+
+def get_font(size):
+    font = _FONT_CACHE.get(size)
+    if font is None:
+        font = _FONT_CACHE[size] = pygame.font.SysFont(None, size)
+    return font
+
 def draw_text(screen, text, size, x, y, color=BLACK):
-    font = pygame.font.SysFont(None, size)
-    img = font.render(text, True, color)
+    # Re-render only when the string changes; static labels are rendered once
+    key = (text, size, color)
+    img = _TEXT_CACHE.get(key)
+    if img is None:
+        if len(_TEXT_CACHE) >= _TEXT_CACHE_MAX:
+            _TEXT_CACHE.clear()
+        img = _TEXT_CACHE[key] = get_font(size).render(text, True, color)
     screen.blit(img, (x, y))
 
+def build_backgrounds():
+    # Solid backgrounds, rebuilt only on resize and blitted each frame
+    sky_surf = pygame.Surface((SCREEN_WIDTH, GAME_HEIGHT)).convert()
+    sky_surf.fill(SKY_BLUE)
+    plot_surf = pygame.Surface((SCREEN_WIDTH, SIGNAL_HEIGHT)).convert()
+    plot_surf.fill(PLOT_BG)
+    return sky_surf, plot_surf
+
 def main():
     global SCREEN_WIDTH, SCREEN_HEIGHT, GAME_HEIGHT, SIGNAL_HEIGHT
 
     pygame.init()
     screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.RESIZABLE)
     pygame.display.set_caption('Flappy Bird EMG')
+    sky_surf, plot_surf = build_backgrounds()
     clock = pygame.time.Clock()
 
     # Start EMG Handler
@@ -216,7 +275,6 @@ def main():
     bird = Bird(GAME_HEIGHT)
     pipes = []
     score = 0
-    font = pygame.font.SysFont(None, 40)
     
     last_pipe_time = pygame.time.get_ticks()
     last_jump_time = 0
@@ -226,8 +284,9 @@ def main():
     # Gain Variable
     emg_gain = 14.0
     
-    # Signal Plot Buffer
-    plot_buffer = collections.deque([0.0] * SCREEN_WIDTH, maxlen=SCREEN_WIDTH)
+    # Signal Plot Buffer (ring, one sample per pixel column)
+    plot_arr = np.zeros(SCREEN_WIDTH, dtype=np.float32)
+    plot_head = 0
 
     # Main Loop
     while running:
@@ -235,9 +294,9 @@ def main():
         
         # --- DRAW BACKGROUNDS ---
         # Game Area
-        pygame.draw.rect(screen, SKY_BLUE, (0, 0, SCREEN_WIDTH, GAME_HEIGHT))
+        screen.blit(sky_surf, (0, 0))
         # Signal Area
-        pygame.draw.rect(screen, PLOT_BG, (0, GAME_HEIGHT, SCREEN_WIDTH, SIGNAL_HEIGHT))
+        screen.blit(plot_surf, (0, GAME_HEIGHT))
         
         current_time = pygame.time.get_ticks()
         envelope = emg_handler.get_envelope()
@@ -265,10 +324,14 @@ def main():
                     SIGNAL_HEIGHT = 200
                     
                 GAME_HEIGHT = SCREEN_HEIGHT - SIGNAL_HEIGHT
+                sky_surf, plot_surf = build_backgrounds()
                 
-                # Resize Plot Buffer (preserve old data if possible)
-                new_buffer = collections.deque(list(plot_buffer), maxlen=SCREEN_WIDTH)
-                plot_buffer = new_buffer
+                # Resize Plot Buffer (preserve newest data if possible)
+                ordered = np.concatenate((plot_arr[plot_head:], plot_arr[:plot_head]))
+                keep = ordered[-SCREEN_WIDTH:]
+                plot_arr = np.zeros(SCREEN_WIDTH, dtype=np.float32)
+                plot_arr[SCREEN_WIDTH - len(keep):] = keep
+                plot_head = 0
             
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_SPACE:
@@ -290,7 +353,8 @@ def main():
         # 2. EMG Input
         # Apply Gain
         scaled_envelope = envelope * emg_gain
-        plot_buffer.append(scaled_envelope)
+        plot_arr[plot_head] = scaled_envelope
+        plot_head = (plot_head + 1) % SCREEN_WIDTH
         
         if scaled_envelope > EMG_THRESHOLD:
             if current_time - last_jump_time > JUMP_COOLDOWN:
@@ -308,7 +372,6 @@ def main():
                 pipes.append(Pipe(SCREEN_WIDTH, GAME_HEIGHT))
                 last_pipe_time = current_time
 
-            pipes_to_remove = []
             for pipe in pipes:
                 pipe.move()
                 pipe.draw(screen)
@@ -317,18 +380,15 @@ def main():
                 if pipe.x + pipe.width < bird.x and not pipe.passed:
                     pipe.passed = True
                     score += 1
-                if pipe.x < -pipe.width:
-                    pipes_to_remove.append(pipe)
-            for pipe in pipes_to_remove:
-                pipes.remove(pipe)
+            # Drop off-screen pipes in one pass
+            pipes = [pipe for pipe in pipes if pipe.x >= -pipe.width]
 
             # Ground/Ceiling
             if bird.y >= GAME_HEIGHT - bird.height or bird.y < 0:
                 game_active = False
 
             # Score
-            score_surface = font.render(str(score), True, WHITE)
-            screen.blit(score_surface, (SCREEN_WIDTH // 2, 50))
+            draw_text(screen, str(score), 40, SCREEN_WIDTH // 2, 50, color=WHITE)
             
         else:
             # Game Over
@@ -338,18 +398,15 @@ def main():
 
         # --- DRAW SIGNAL PLOT ---
         # 1. Points
-        points = []
-        
-        
-        for x, val in enumerate(plot_buffer):
-            # Scale val to fit in SIGNAL_HEIGHT (0 to 2V approx range covers most)
-            # Origin is bottom-left of plot area: (x, SCREEN_HEIGHT)
-            # Subtract value: (x, SCREEN_HEIGHT - (val * scale))
-            plot_y = SCREEN_HEIGHT - min(int(val * 100), SIGNAL_HEIGHT - 10) 
-            points.append((x, plot_y))
-            
+        # Scale val to fit in SIGNAL_HEIGHT (0 to 2V approx range covers most)
+        # Origin is bottom-left of plot area: (x, SCREEN_HEIGHT)
+        # Subtract value: (x, SCREEN_HEIGHT - (val * scale))
+        ordered = np.concatenate((plot_arr[plot_head:], plot_arr[:plot_head]))
+        plot_y = SCREEN_HEIGHT - np.minimum((ordered * 100).astype(np.int32), SIGNAL_HEIGHT - 10)
+        points = np.column_stack((np.arange(len(plot_y)), plot_y))
+
         if len(points) > 1:
-            pygame.draw.lines(screen, PLOT_LINE, False, points, 2)
+            pygame.draw.lines(screen, PLOT_LINE, False, points.tolist(), 2)
             
         # 2. Threshold Line
         thresh_h = min(int(EMG_THRESHOLD * 100), SIGNAL_HEIGHT - 10)
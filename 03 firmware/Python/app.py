@@ -1,11 +1,12 @@
 import sys
 import socket
-import struct
-import csv
+import tempfile
+import threading
 import time
 import numpy as np
 from collections import deque
-from scipy.signal import butter, sosfilt, sosfilt_zi, iirnotch, lfilter, lfilter_zi
+from numba import njit
+from scipy.signal import butter, sosfilt_zi, iirnotch, tf2sos
 
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLabel, QLineEdit, QPushButton, QFrame, 
@@ -18,40 +19,74 @@ DEFAULT_PORT = 8888
 SAMPLE_RATE = 25000.0   # 25 kSPS
 WINDOW_SECONDS = 10     
 MAX_POINTS = int(SAMPLE_RATE * WINDOW_SECONDS)
+RCVBUF_SIZE = 4 << 20   # Kernel socket buffer, absorbs GUI stalls
+PACKET_SIZE = 65507     # Largest UDP payload, so no datagram is ever truncated
+SAVE_BLOCK = 1 << 20    # Samples per block when converting a capture to CSV
 
 # Voltage Reference Math
 VOLTAGE_REF = 1.65
 ADC_MAX_VAL = 512.0 
+_ADC_SCALE = VOLTAGE_REF / ADC_MAX_VAL # ADC counts -> volts
+
+# Must be set before any PlotWidget is created to take effect
+pg.setConfigOptions(useOpenGL=True, antialias=False, enableExperimental=True)
+
+# --- FILTER KERNEL ---
+@njit(cache=True, fastmath=True, nogil=True)
+def biquad_cascade(x, sos, zi):
+    """Filter x in place through an SOS cascade (transposed direct form II), updating zi."""
+    # Sections outer, samples inner: each section's coefficients and state
+    # stay in registers for the whole chunk (sos must be a C-contiguous (K, 6))
+    for s in range(sos.shape[0]):
+        b0, b1, b2 = sos[s, 0], sos[s, 1], sos[s, 2]
+        a1, a2 = sos[s, 4], sos[s, 5]
+        z0, z1 = zi[s, 0], zi[s, 1]
+        for n in range(x.shape[0]):
+            v = x[n]
+            out = b0 * v + z0
+            z0 = b1 * v - a1 * out + z1
+            z1 = b2 * v - a2 * out
+            x[n] = out
+        zi[s, 0] = z0
+        zi[s, 1] = z1
+    return x
 
 # --- WORKER THREAD ---
 class UDPWorker(QThread):
-    data_received = pyqtSignal(list)
     error_occurred = pyqtSignal(str)
 
-    def __init__(self, ip, port):
+    def __init__(self, ip, port, on_samples):
         super().__init__()
         self.ip = ip
         self.port = port
         self.running = False
         self.sock = None
 
+        # Called on this thread for every packet, so filtering runs off the
+        # GUI thread; it must copy what it keeps before the next packet arrives
+        self.on_samples = on_samples
+
+        # Reused for every packet
+        self._recv_buf = bytearray(PACKET_SIZE)
+        self._recv_samples = np.frombuffer(self._recv_buf, dtype='<i2')
+
     def run(self):
         self.running = True
         try:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.sock.bind((self.ip, self.port))
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_SIZE)
+            if self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) < RCVBUF_SIZE:
+                # Not fatal, so log it rather than raising an error dialog on every connect
+                print("Warning: UDP receive buffer capped by the OS (raise net.core.rmem_max)")
             self.sock.settimeout(1.0)
             
             while self.running:
                 try:
-                    data, _ = self.sock.recvfrom(4096)
+                    nbytes, _ = self.sock.recvfrom_into(self._recv_buf)
                     
-                    # Decode Binary (Signed Short 'h')
-                    num_samples = len(data) // 2
-                    fmt = '<' + 'h' * num_samples
-                    values = struct.unpack(fmt, data)
-                    
-                    self.data_received.emit(list(values))
+                    # Decode Binary (Signed Short 'h') as a view of the receive buffer
+                    self.on_samples(self._recv_samples[:nbytes // 2])
                     
                 except socket.timeout:
                     continue
@@ -76,24 +111,49 @@ class OscilloscopeApp(QMainWindow):
         self.resize(1200, 900)
         
         # --- BUFFERS ---
-        self.plot_buffer = deque([0.0] * MAX_POINTS, maxlen=MAX_POINTS)
-        self.recording_buffer = [] 
+        # Plot ring, stored twice back-to-back so the newest MAX_POINTS samples
+        # are always the contiguous view _ring[_w:_w + MAX_POINTS]. Written by the
+        # UDP thread, read by the GUI timer; _w is published after each write.
+        self._ring = np.zeros(2 * MAX_POINTS, dtype=np.float32)
+        self._w = 0
+        self._dirty = True # Set by _write, cleared when the plot is refreshed
+        # float32 chunks queued by the UDP thread; the GUI timer spills them to
+        # a temp file with tofile(), so RAM stays bounded however long the capture
+        self.recording_buffer = deque()
+        # Held by _write across the is_recording check and append, so once
+        # stop_recording has cleared the flag under it no chunk can still arrive
+        self._rec_lock = threading.Lock()
+        self._rec_file = None
+        self._rec_samples = 0
         self.worker = None
 
         # --- STATE ---
         self.is_recording = False
         self.record_start_time = 0
+        self._last_timer_str = "00:00.0"
 
         # --- FILTER STATE ---
         self.bp_enabled = False
         self.bp_sos = None   
-        self.bp_zi = None    
 
         self.notch_enabled = False
-        self.notch_coeffs = []
-        self.notch_zis = []
+        self.notch_sos = None
         self.init_notch_filters()
 
+        # Notch + bandpass sections stacked into one (K, 6) SOS array with one
+        # (K, 2) state array; the enabled rows run as a single fused pass
+        self.sos_all = None
+        self.zi_all = None
+        self.filter_chain = None # (sos, zi view) of the enabled stages, or None
+        self.stack_filters()
+
+        # Filter updates queued by the GUI. handle_data runs them on the UDP
+        # thread between chunks, so the running filter state has a single writer.
+        self.filter_updates = deque()
+
+        # Compile the filter kernel now rather than on the first packet
+        biquad_cascade(np.zeros(1, dtype=np.float32), self.sos_all, self.zi_all.copy())
+
         # --- UI SETUP ---
         self.init_ui()
         self.apply_theme()
@@ -106,13 +166,40 @@ class OscilloscopeApp(QMainWindow):
     def init_notch_filters(self):
         freqs = [50.0, 100.0, 150.0]
         quality_factor = 30.0 
-        self.notch_coeffs = []
-        self.notch_zis = []
-        for f in freqs:
-            b, a = iirnotch(f, quality_factor, fs=SAMPLE_RATE)
-            self.notch_coeffs.append((b, a))
-            zi = lfilter_zi(b, a)
-            self.notch_zis.append(zi)
+        # Notches are biquads too: store them as SOS rows once, at design time
+        self.notch_sos = np.vstack([tf2sos(*iirnotch(f, quality_factor, fs=SAMPLE_RATE))
+                                    for f in freqs])
+
+    def stack_filters(self):
+        n_notch = len(self.notch_sos)
+        sections = [self.notch_sos]
+        if self.bp_sos is not None:
+            sections.append(self.bp_sos)
+        # float64 coefficients and state (only the samples are float32): the
+        # high-Q notches and low-cutoff bandpasses need the extra precision
+        self.sos_all = np.ascontiguousarray(np.vstack(sections))
+
+        # Keep the running notch state; (re)initialise the bandpass rows. States
+        # are in volts (see rebuild_filter_chain), so start from a 1-count step.
+        zi_all = sosfilt_zi(self.sos_all) * _ADC_SCALE
+        if self.zi_all is not None:
+            zi_all[:n_notch] = self.zi_all[:n_notch]
+        self.zi_all = zi_all
+        self.rebuild_filter_chain()
+
+    def rebuild_filter_chain(self):
+        # The ADC->volt scale is folded into the b coefficients of the first
+        # enabled section. Scaling b only scales a section's output and state,
+        # so all states stay in volts whichever stage carries the factor.
+        n_notch = len(self.notch_sos)
+        start = 0 if self.notch_enabled else n_notch
+        stop = len(self.sos_all) if (self.bp_enabled and self.bp_sos is not None) else n_notch
+        if start >= stop:
+            self.filter_chain = None
+            return
+        sos = self.sos_all[start:stop].copy()
+        sos[0, :3] *= _ADC_SCALE
+        self.filter_chain = (sos, self.zi_all[start:stop])
 
     def init_ui(self):
         main_widget = QWidget()
@@ -152,8 +239,12 @@ class OscilloscopeApp(QMainWindow):
         self.chk_notch = QCheckBox("Remove 50/100/150Hz")
         self.chk_notch.setStyleSheet("color: #FF9E00;")
         self.chk_notch.toggled.connect(self.toggle_notch)
+        self.btn_notch_reset = QPushButton("RESET")
+        self.btn_notch_reset.setFixedWidth(50)
+        self.btn_notch_reset.clicked.connect(self.reset_notch_state)
         
         layout_notch.addWidget(self.chk_notch)
+        layout_notch.addWidget(self.btn_notch_reset)
         grp_notch.setLayout(layout_notch)
 
         # 3. Bandpass Filter
@@ -197,8 +288,17 @@ class OscilloscopeApp(QMainWindow):
         self.plot_widget.showGrid(x=True, y=True, alpha=0.2)
         self.plot_widget.showAxis('bottom', False) 
         self.plot_widget.setLabel('left', 'Voltage (V)', units='V')
+        self.plot_widget.setAntialiasing(False)
+        self.plot_widget.disableAutoRange()
+        self.plot_widget.setXRange(0, WINDOW_SECONDS, padding=0)
         self.plot_widget.setYRange(-1.7, 1.7, padding=0)
+        self.plot_widget.setMouseEnabled(x=False, y=False)
         self.curve = self.plot_widget.plot(pen=pg.mkPen(color='#00B4D8', width=1))
+        # Only draw ~one min/max pair per pixel instead of all MAX_POINTS vertices
+        self.curve.setDownsampling(auto=True, method='peak')
+        self.curve.setClipToView(True)
+        # Static time axis, same dtype as the ring so nothing is upcast per frame
+        self.x_axis = (np.arange(MAX_POINTS) / SAMPLE_RATE).astype(np.float32)
 
         # --- BOTTOM FOOTER (Recorder) ---
         footer = QFrame()
@@ -221,7 +321,7 @@ class OscilloscopeApp(QMainWindow):
         self.btn_rec_stop.setEnabled(False)
         self.btn_rec_stop.setStyleSheet("background-color: #333; color: #555;") 
         
-        self.lbl_rec_timer = QLabel("00:00.000")
+        self.lbl_rec_timer = QLabel("00:00.0")
         self.lbl_rec_timer.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.lbl_rec_timer.setStyleSheet("color: #666; font-family: monospace; font-size: 16px; font-weight: bold;")
         
@@ -261,8 +361,7 @@ class OscilloscopeApp(QMainWindow):
                 self.btn_start.setChecked(False)
                 return
             self.btn_start.setText("STOP")
-            self.worker = UDPWorker(self.txt_ip.text(), port)
-            self.worker.data_received.connect(self.handle_data)
+            self.worker = UDPWorker(self.txt_ip.text(), port, self.handle_data)
             self.worker.error_occurred.connect(lambda e: QMessageBox.warning(self, "Error", e))
             self.worker.start()
         else:
@@ -272,7 +371,9 @@ class OscilloscopeApp(QMainWindow):
                 self.worker = None
 
     def start_recording(self):
-        self.recording_buffer = [] 
+        self.recording_buffer = deque()
+        self._rec_file = tempfile.TemporaryFile()
+        self._rec_samples = 0
         self.record_start_time = time.time()
         self.is_recording = True
         
@@ -285,7 +386,8 @@ class OscilloscopeApp(QMainWindow):
         self.lbl_rec_timer.setStyleSheet("color: #D90429; font-family: monospace; font-size: 16px; font-weight: bold;")
 
     def stop_recording(self):
-        self.is_recording = False
+        with self._rec_lock:
+            self.is_recording = False
         
         self.btn_rec_start.setEnabled(True)
         self.btn_rec_start.setStyleSheet("background-color: #225522; color: #8F8; font-weight: bold;")
@@ -293,27 +395,53 @@ class OscilloscopeApp(QMainWindow):
         self.btn_rec_stop.setEnabled(False)
         self.btn_rec_stop.setStyleSheet("background-color: #333; color: #555;")
         
-        self.lbl_rec_timer.setText("00:00.000")
+        self.lbl_rec_timer.setText("00:00.0")
+        self._last_timer_str = "00:00.0"
         self.lbl_rec_timer.setStyleSheet("color: #666; font-family: monospace; font-size: 16px; font-weight: bold;")
 
-        if not self.recording_buffer:
+        self.flush_recording()
+        rec_file, self._rec_file = self._rec_file, None
+        if not self._rec_samples:
+            rec_file.close()
             return
 
         filename, _ = QFileDialog.getSaveFileName(self, "Save Capture", "", "CSV Files (*.csv)")
         if filename:
             try:
+                rec_file.seek(0)
                 with open(filename, 'w', newline='') as csvfile:
-                    writer = csv.writer(csvfile)
-                    writer.writerow(["Sample_Index", "Voltage_V"])
-                    for i, val in enumerate(self.recording_buffer):
-                        writer.writerow([i, val])
-                QMessageBox.information(self, "Saved", f"Saved {len(self.recording_buffer)} samples.")
+                    csvfile.write("Sample_Index,Voltage_V\n")
+                    start = 0
+                    while start < self._rec_samples:
+                        block = np.fromfile(rec_file, dtype=np.float32, count=SAVE_BLOCK)
+                        if block.size == 0:
+                            break
+                        index = np.arange(start, start + block.size)
+                        np.savetxt(csvfile, np.column_stack((index, block)), fmt=['%d', '%.9g'],
+                                   delimiter=',')
+                        start += block.size
+                QMessageBox.information(self, "Saved", f"Saved {self._rec_samples} samples.")
             except Exception as e:
                 QMessageBox.critical(self, "Error", f"Could not save file: {e}")
+        rec_file.close()
+
+    def flush_recording(self):
+        while self.recording_buffer:
+            chunk = self.recording_buffer.popleft()
+            chunk.tofile(self._rec_file)
+            self._rec_samples += chunk.size
 
     def toggle_notch(self):
+        # Coefficients never change; keep the filter state so toggling doesn't glitch
         self.notch_enabled = self.chk_notch.isChecked()
-        self.init_notch_filters()
+        self.filter_updates.append(self.rebuild_filter_chain)
+
+    def reset_notch_state(self):
+        self.filter_updates.append(self._reset_notch_zi)
+
+    def _reset_notch_zi(self):
+        n_notch = len(self.notch_sos)
+        self.zi_all[:n_notch] = sosfilt_zi(self.sos_all[:n_notch]) * _ADC_SCALE
 
     def recalc_bp_filter(self):
         try:
@@ -324,39 +452,63 @@ class OscilloscopeApp(QMainWindow):
 
             nyquist = SAMPLE_RATE / 2.0
             self.bp_sos = butter(order, [low/nyquist, high/nyquist], btype='bandpass', output='sos')
-            self.bp_zi = sosfilt_zi(self.bp_sos)
             self.bp_enabled = self.chk_bp.isChecked()
+            self.filter_updates.append(self.stack_filters)
         except:
             self.bp_enabled = False
+            self.filter_updates.append(self.rebuild_filter_chain)
 
     def handle_data(self, values):
-        chunk = np.array(values, dtype=float)
+        chunk = np.asarray(values, dtype=np.float32) # New array, safe to filter in place
 
-        if self.notch_enabled:
-            for i in range(len(self.notch_coeffs)):
-                b, a = self.notch_coeffs[i]
-                chunk, self.notch_zis[i] = lfilter(b, a, chunk, zi=self.notch_zis[i])
+        while self.filter_updates:
+            self.filter_updates.popleft()()
 
-        if self.bp_enabled and self.bp_sos is not None:
-            chunk, self.bp_zi = sosfilt(self.bp_sos, chunk, zi=self.bp_zi)
-            
-        voltage_chunk = chunk * (VOLTAGE_REF / ADC_MAX_VAL)
+        chain = self.filter_chain
+        if chain is not None:
+            sos, zi = chain
+            biquad_cascade(chunk, sos, zi)
+        else:
+            # No filter to carry the scale: convert to volts in place
+            np.multiply(chunk, _ADC_SCALE, out=chunk)
         
-        self.plot_buffer.extend(voltage_chunk)
-
-        if self.is_recording:
-            self.recording_buffer.extend(voltage_chunk)
+        self._write(chunk)
+
+    def _write(self, chunk):
+        # Single sink for filtered samples: plot ring and, while recording, the capture
+        w = self._w
+        n = len(chunk)
+        first = min(n, MAX_POINTS - w)
+        for base in (w, w + MAX_POINTS):
+            self._ring[base:base + first] = chunk[:first]
+        for base in (0, MAX_POINTS):
+            self._ring[base:base + n - first] = chunk[first:]
+        with self._rec_lock:
+            if self.is_recording:
+                self.recording_buffer.append(chunk) # chunk is never reused, no copy needed
+        self._w = (w + n) % MAX_POINTS
+        self._dirty = True
 
     def update_gui_loop(self):
-        if self.plot_buffer:
-            self.curve.setData(np.array(self.plot_buffer))
+        if self._dirty:
+            # Clear before reading _w so a write landing now marks the next tick
+            self._dirty = False
+            w = self._w
+            # Samples come from int16 through stable filters, so skip pyqtgraph's NaN scan
+            self.curve.setData(x=self.x_axis, y=self._ring[w:w + MAX_POINTS],
+                               skipFiniteCheck=True, connect='all')
 
         if self.is_recording:
-            elapsed = time.time() - self.record_start_time
-            minutes = int(elapsed // 60)
-            seconds = int(elapsed % 60)
-            millis = int((elapsed % 1) * 1000)
-            self.lbl_rec_timer.setText(f"{minutes:02}:{seconds:02}.{millis:03}")
+            self.flush_recording()
+
+            # Tenths are enough at 30 FPS; skip the Qt relayout when nothing changed
+            tenths = int((time.time() - self.record_start_time) * 10)
+            minutes, tenths = divmod(tenths, 600)
+            seconds, tenths = divmod(tenths, 10)
+            timer_str = f"{minutes:02}:{seconds:02}.{tenths}"
+            if timer_str != self._last_timer_str:
+                self.lbl_rec_timer.setText(timer_str)
+                self._last_timer_str = timer_str
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -1,24 +1,35 @@
+import select
 import socket
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
-import struct
-from collections import deque
+import numpy as np
 
 # --- CONFIGURATION ---
 UDP_IP = "0.0.0.0" 
 UDP_PORT = 8888
 MAX_POINTS = 250000 # 0.5 seconds of data at 25 kSPS
+MAX_PACKETS_PER_FRAME = 32 # Drain cap per frame so a backlog can't stall one redraw
+RCVBUF_SIZE = 4 << 20 # Holds the packets that arrive during a slow redraw
+PACKET_SIZE = 65507 # Max UDP payload: recv_into would silently cut anything longer
 
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 sock.bind((UDP_IP, UDP_PORT))
+sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_SIZE)
+if sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) < RCVBUF_SIZE:
+    print("Warning: UDP receive buffer capped by the OS (raise net.core.rmem_max)")
 sock.setblocking(False)
 
-# Buffer to hold plot data
-data_buffer = deque([0] * MAX_POINTS, maxlen=MAX_POINTS)
+# Preallocated receive buffers, reused every frame
+recv_bufs = [bytearray(PACKET_SIZE) for _ in range(MAX_PACKETS_PER_FRAME)]
+
+# Buffer to hold plot data: a ring stored twice back-to-back, so the newest
+# MAX_POINTS samples are always the contiguous view data_buffer[write_idx:write_idx + MAX_POINTS]
+data_buffer = np.zeros(2 * MAX_POINTS, dtype=np.int16)
+write_idx = 0
 
 # Setup Plot
 fig, ax = plt.subplots()
-line, = ax.plot(data_buffer)
+line, = ax.plot(data_buffer[:MAX_POINTS])
 
 # Axis Configuration
 # Range is -1024 to +1024 because we are subtracting signals
@@ -31,29 +42,39 @@ ax.grid(True)
 # Draw a red center line at 0
 ax.axhline(y=0, color='r', linestyle='-', alpha=0.3)
 
+def push_samples(values):
+    global write_idx
+    values = values[-MAX_POINTS:]
+    n = len(values)
+    first = min(n, MAX_POINTS - write_idx)
+    for base in (write_idx, write_idx + MAX_POINTS):
+        data_buffer[base:base + first] = values[:first]
+    for base in (0, MAX_POINTS):
+        data_buffer[base:base + n - first] = values[first:]
+    write_idx = (write_idx + n) % MAX_POINTS
+
 def update_plot(frame):
-    try:
-        while True:
-            # Receive Packet
-            data, _ = sock.recvfrom(2048)
-            
-            # Calculate number of samples (2 bytes per sample)
-            num_samples = len(data) // 2
-            
-            # Unpack Binary
-            # '<' = Little Endian
-            # 'h' = Signed Short (This is the key change for differential)
-            fmt = '<' + 'h' * num_samples
-            values = struct.unpack(fmt, data)
-            
-            data_buffer.extend(values)
-            
-    except BlockingIOError:
-        pass # No data waiting
-    except struct.error:
-        print("Packet Error")
-
-    line.set_ydata(data_buffer)
+    chunks = []
+    # One readiness check per frame: skip the drain entirely when idle
+    readable, _, _ = select.select([sock], [], [], 0)
+    if readable:
+        try:
+            for buf in recv_bufs:
+                # Receive Packet
+                nbytes = sock.recv_into(buf)
+                
+                # Decode Binary as a zero-copy view
+                # '<' = Little Endian
+                # 'i2' = Signed Short (This is the key change for differential)
+                chunks.append(np.frombuffer(buf, dtype='<i2', count=nbytes // 2))
+                
+        except BlockingIOError:
+            pass # Queue drained
+
+    if chunks:
+        push_samples(np.concatenate(chunks))
+
+    line.set_ydata(data_buffer[write_idx:write_idx + MAX_POINTS])
     return line,
 
 # Animate